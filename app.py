@@ -1,33 +1,57 @@
 # app.py
+import hashlib
 import os
+import re
+import secrets
+import tempfile
+import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
+from decimal import Decimal
+from functools import lru_cache, wraps
 from zoneinfo import ZoneInfo
 
+import orjson
 import requests as http_requests  # Brevo HTTP client
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from email.message import EmailMessage  # imported but not used; fine
 
+from cachetools import TTLCache
 from flask import (
     Flask,
+    Request,
+    current_app,
+    g,
     jsonify,
     request,
     send_from_directory,
-    render_template_string,
+    render_template,
+    stream_with_context,
 )
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from flask_cors import CORS
-from flask_login import LoginManager
+from flask_login import LoginManager, UserMixin
 from flask_jwt_extended import (
     JWTManager,
     create_access_token,
     jwt_required,
     get_jwt_identity,
     get_jwt,
+    verify_jwt_in_request,
 )
+from sqlalchemy.exc import DBAPIError
+from werkzeug.exceptions import BadRequest
+from werkzeug.formparser import FormDataParser, MultiPartParser
+from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
+from markupsafe import escape
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 
-from models import db, User, Product, StockRequest, Notification
+from models import db, User, Product, StockRequest, Notification, is_low_stock
 from config import Config
 
 EASTERN = ZoneInfo("America/New_York")
@@ -42,9 +66,479 @@ LOGIN_PAGE_URL = os.getenv("FOGON_LOGIN_URL", "/login-page")
 BREVO_API_KEY = os.getenv("BREVO_API_KEY", "")
 BREVO_SENDER_EMAIL = os.getenv("MAIL_FROM", "no-reply@fogonims.com")
 BREVO_SENDER_NAME = os.getenv("MAIL_FROM_NAME", "FogonIMS")
+BREVO_EMAIL_URL = "https://api.brevo.com/v3/smtp/email"
+BREVO_SENDER = {"name": BREVO_SENDER_NAME, "email": BREVO_SENDER_EMAIL}
+# Static part of the reset email; each send only adds "to" and the body.
+BREVO_RESET_TEMPLATE = {
+    "sender": BREVO_SENDER,
+    "subject": "FogonIMS – Password Reset",
+}
+RESET_EMAIL_TEXT = (
+    "Hi,\n\n"
+    "We received a request to reset your FogonIMS password.\n\n"
+    "Click the link below to reset it:\n{link}\n\n"
+    "If you didn't request this, you can ignore this email.\n"
+)
+
+# One keep-alive session for Brevo so each email skips the TCP/TLS handshake.
+# Only throttling / gateway errors are retried (the send didn't happen).
+_BREVO_SESSION = http_requests.Session()
+_BREVO_SESSION.headers.update(
+    {
+        "accept": "application/json",
+        "api-key": BREVO_API_KEY,
+        "content-type": "application/json",
+    }
+)
+_BREVO_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Liveness probe body, serialized once. A fresh Response is still built per
+# hit because after_request hooks (CORS) write headers onto it. The route
+# touches neither JWT nor the DB session, so a probe never checks out a
+# pooled connection.
+HEALTH_BODY = b'{"ok":true}\n'
+
+# CORS only for the mobile API; pattern compiled once at import
+API_CORS_RESOURCES = {re.compile(r"/api/.*"): {"origins": "*"}}
+
+
+# ---------- JSON provider ----------
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson.
+    Decimal columns (e.g. Product.price, SUM(...) report totals) are emitted
+    as JSON numbers, so handlers can pass them through without float().
+    Naive datetimes (DB values are UTC) are emitted with a +00:00 offset.
+    """
+
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+
+    # Unlike DefaultJSONProvider, keys keep insertion order unless
+    # app.json.sort_keys or dumps(sort_keys=True) asks for sorting. The other
+    # json.dumps kwargs (indent, ensure_ascii, separators, ...) are ignored.
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return DefaultJSONProvider.default(o)
+
+    def _option(self, sort_keys=None) -> int:
+        if sort_keys is None:
+            sort_keys = self.sort_keys
+        return self.option | orjson.OPT_SORT_KEYS if sort_keys else self.option
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = self._option(kwargs.get("sort_keys"))
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def dumps_bytes(self, obj) -> bytes:
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=self._option() | orjson.OPT_APPEND_NEWLINE,
+        )
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # build the body straight from orjson's bytes (no str round trip)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            self.dumps_bytes(obj), mimetype=self.mimetype
+        )
+
+
+# ---------- Roles / tokens ----------
+# Role travels in the JWT as a small int ("r") instead of a string.
+ROLE_MANAGER = 1
+ROLE_COOK = 2
+ROLE_CODES = {"manager": ROLE_MANAGER, "cook": ROLE_COOK}
+ROLE_NAMES = {code: name for name, code in ROLE_CODES.items()}
+
+
+def issue_access_token(user) -> str:
+    return create_access_token(
+        identity=user.username,
+        additional_claims={
+            "id": user.id,
+            "r": ROLE_CODES.get(user.role, 0),
+            "name": user.name,
+        },
+    )
+
+
+def token_role(claims) -> int:
+    """
+    Role code from JWT claims. Tokens issued before the "r" claim carry
+    the role name instead.
+    """
+    code = claims.get("r")
+    if code is None:
+        code = ROLE_CODES.get((claims.get("role") or "").lower(), 0)
+    return code
+
+
+# ---------- JWT verification cache ----------
+# sha256(token)[:32] -> (jwt_header, jwt_data); short TTL so a revoked or
+# re-issued token is only trusted from cache for a few seconds.
+_token_cache = TTLCache(maxsize=10_000, ttl=5)
+_token_cache_lock = threading.RLock()
+
+
+def cached_jwt_required():
+    """
+    Drop-in for @jwt_required() that skips signature verification when the
+    same bearer token was verified in the last few seconds.
+    get_jwt() / get_jwt_identity() keep working because the decoded token is
+    stored on flask.g exactly where flask_jwt_extended looks for it.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            auth = request.headers.get("Authorization") or ""
+            scheme, _, token = auth.partition(" ")
+            key = None
+            hit = None
+            if scheme == "Bearer" and token:
+                key = hashlib.sha256(token.encode()).hexdigest()[:32]
+                with _token_cache_lock:
+                    hit = _token_cache.get(key)
+
+            if hit is not None and hit[1].get("exp", 0) > time.time():
+                jwt_header, jwt_data = hit
+                g._jwt_extended_jwt_user = {"loaded_user": None}
+                g._jwt_extended_jwt_header = jwt_header
+                g._jwt_extended_jwt = jwt_data
+                g._jwt_extended_jwt_location = "headers"
+            else:
+                # full verification; raises the usual 401/422 errors
+                verified = verify_jwt_in_request()
+                if key is not None and verified:
+                    with _token_cache_lock:
+                        _token_cache[key] = verified
+
+            claims = g._jwt_extended_jwt
+            g.uid = claims.get("id")
+            g.role = token_role(claims)
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def require_role(role: int, error: str = "Manager role required"):
+    """
+    403 unless the caller's role code matches. Goes *below*
+    @cached_jwt_required(), which puts the role on flask.g.
+    """
+    forbidden_body = orjson.dumps({"error": error})
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if g.role != role:
+                return current_app.response_class(
+                    forbidden_body, status=403, mimetype="application/json"
+                )
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ---------- Session user cache ----------
+class SessionUser(UserMixin):
+    """Detached, read-only copy of a users row for Flask-Login."""
+
+    def __init__(self, id, username, name, role):
+        self.id = id
+        self.username = username
+        self.name = name
+        self.role = role
+
+
+_user_cache = TTLCache(maxsize=1024, ttl=30)
+_user_cache_lock = threading.Lock()
+
+
+def get_session_user(uid: int):
+    user = g.get("_user")
+    if user is not None and user.id == uid:
+        return user
+
+    with _user_cache_lock:
+        user = _user_cache.get(uid)
+    if user is None:
+        row = db.session.execute(
+            db.select(User.id, User.username, User.name, User.role).where(
+                User.id == uid
+            )
+        ).first()
+        if row is None:
+            return None
+        user = SessionUser(*row)
+        with _user_cache_lock:
+            _user_cache[uid] = user
+
+    g._user = user
+    return user
+
+
+def forget_session_user(uid: int):
+    with _user_cache_lock:
+        _user_cache.pop(uid, None)
+
+
+# ---------- Manager id cache ----------
+# Ids of every manager, who receive LOW_STOCK / REQUEST_CREATED notifications.
+# Short TTL so a manager registered on another gunicorn worker shows up soon.
+_manager_ids_cache = TTLCache(maxsize=1, ttl=30)
+_manager_ids_lock = threading.Lock()
+
+
+def get_manager_ids() -> tuple:
+    with _manager_ids_lock:
+        ids = _manager_ids_cache.get("ids")
+    if ids is None:
+        ids = tuple(
+            db.session.scalars(
+                db.select(User.id).where(User.role == "manager")
+            ).all()
+        )
+        with _manager_ids_lock:
+            _manager_ids_cache["ids"] = ids
+    return ids
+
+
+def forget_manager_ids():
+    with _manager_ids_lock:
+        _manager_ids_cache.clear()
+
+
+# ---------- Per-product JSON fragments ----------
+# product id -> (row tuple, serialized object). A fragment is reused only
+# while the row read from the DB is identical, so it never goes stale (even
+# across gunicorn workers) and writes don't need to invalidate it.
+_product_frags: dict[int, tuple] = {}
+
+# columns product_fragment() expects, in order
+PRODUCT_ROW_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.quantity,
+    # MySQL can't CAST to FLOAT; coerce the result type instead so
+    # SQLAlchemy's compiled Float processor converts the Decimal
+    db.type_coerce(Product.price, db.Float).label("price"),
+    Product.description,
+    Product.image_url,
+    Product.reorder_threshold,
+    Product.vendor_name,
+    Product.vendor_contact,
+    Product.category,
+)
+
+
+def product_fragment(row) -> bytes:
+    """row: a select(*PRODUCT_ROW_COLUMNS) result row."""
+    row = tuple(row)
+    hit = _product_frags.get(row[0])
+    if hit is not None and hit[0] == row:
+        return hit[1]
+
+    pid, name, qty, price, desc, img, thr, vname, vcontact, cat = row
+    frag = orjson.dumps(
+        {
+            "id": pid,
+            "name": name,
+            "quantity": qty,
+            "price": price or 0.0,
+            "description": desc or "",
+            "image_url": img,
+            "reorder_threshold": thr or 0,
+            "is_low_stock": is_low_stock(qty, thr),
+            "vendor_name": vname,
+            "vendor_contact": vcontact,
+            "category": cat,
+        }
+    )
+    _product_frags[pid] = (row, frag)
+    return frag
+
+
+def prune_product_fragments(live_ids: set):
+    for pid in _product_frags.keys() - live_ids:
+        _product_frags.pop(pid, None)
+
+
+# ---------- Conditional responses ----------
+def body_etag(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def conditional_json(body: bytes, etag: str = None, max_age: int = 5):
+    """
+    JSON response carrying a weak ETag; 304 when If-None-Match matches.
+    The tag is derived from the body so it agrees across gunicorn workers.
+    """
+    resp = current_app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag or body_etag(body), weak=True)
+    resp.cache_control.private = True
+    resp.cache_control.max_age = max_age
+    return resp.make_conditional(request)
+
+
+# ---------- Product list cache ----------
+# Serialized GET /api/products (body, etag) pairs keyed by ?filter. "ver" is bumped on
+# every product / quantity change; the short TTL bounds staleness across
+# gunicorn workers, which each keep their own copy.
+_products_cache = {"ver": 0, "bytes": TTLCache(maxsize=8, ttl=5)}
+_products_cache_lock = threading.Lock()
+
+
+def invalidate_products_cache():
+    with _products_cache_lock:
+        _products_cache["ver"] += 1
+        _products_cache["bytes"].clear()
+    # every product / quantity change can move the report numbers too
+    invalidate_reports_cache()
+    mark_low_stock_dirty()
+
+
+# ---------- Report cache ----------
+# Manager report bodies keyed by (path, query string), kept for a minute so
+# dashboard polling doesn't re-run the GROUP BYs. Cleared with the product
+# cache, which covers approvals and price / quantity edits.
+REPORT_CACHE_TTL = 60
+_reports_cache = {"ver": 0, "bytes": TTLCache(maxsize=128, ttl=REPORT_CACHE_TTL)}
+_reports_cache_lock = threading.Lock()
+
+
+def invalidate_reports_cache():
+    with _reports_cache_lock:
+        _reports_cache["ver"] += 1
+        _reports_cache["bytes"].clear()
+
+
+def cached_report(fn):
+    """
+    Serves a manager report from _reports_cache. Goes below
+    @require_role(ROLE_MANAGER, ...), so only managers ever reach the cache.
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (request.path, request.query_string)
+        with _reports_cache_lock:
+            ver = _reports_cache["ver"]
+            cached = _reports_cache["bytes"].get(key)
+        if cached is not None:
+            return conditional_json(*cached)
+
+        resp = current_app.make_response(fn(*args, **kwargs))
+        if resp.status_code != 200:
+            return resp
+        body = resp.get_data()
+        etag = body_etag(body)
+        with _reports_cache_lock:
+            if _reports_cache["ver"] == ver:
+                _reports_cache["bytes"][key] = (body, etag)
+        return conditional_json(body, etag)
+
+    return wrapper
+
+
+# ---------- Password hashing pool ----------
+# KDF work (login checks, register / reset hashing) runs on native OS threads,
+# at most one hash per CPU in flight per worker process; hashlib releases the
+# GIL while it hashes. Under gunicorn's gevent worker, monkey.patch_all() turns
+# ThreadPoolExecutor threads into greenlets on the worker's single OS thread,
+# so there a gevent ThreadPool (real threads; the waiting greenlet yields to
+# the hub) is used instead. Built on first use, i.e. after the worker patched.
+HASH_POOL_SIZE = os.cpu_count() or 2
+_hash_pool_lock = threading.Lock()
+_hash_pool_apply = None
+
+
+def _make_hash_pool_apply():
+    try:
+        from gevent import monkey
+        from gevent.threadpool import ThreadPool
+    except ImportError:
+        monkey = None
+
+    if monkey is not None and monkey.is_module_patched("threading"):
+        return ThreadPool(HASH_POOL_SIZE).apply
+
+    executor = ThreadPoolExecutor(
+        max_workers=HASH_POOL_SIZE, thread_name_prefix="pwhash"
+    )
+    return lambda fn, args: executor.submit(fn, *args).result()
+
+
+def run_kdf(fn, *args):
+    global _hash_pool_apply
+    if _hash_pool_apply is None:
+        with _hash_pool_lock:
+            if _hash_pool_apply is None:
+                _hash_pool_apply = _make_hash_pool_apply()
+    return _hash_pool_apply(fn, args)
+
+
+def check_password_pooled(password_hash: str, password: str) -> bool:
+    return run_kdf(check_password_hash, password_hash, password)
+
+
+def hash_password_pooled(password: str) -> str:
+    return run_kdf(generate_password_hash, password)
+
+
+# ---------- Background email ----------
+# /api/password/forgot answers {"ok": true} either way, so the Brevo call
+# doesn't need to hold up the request.
+_EMAIL_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="email")
+# The executor's queue is unbounded; cap in-flight + queued sends so a burst
+# of forgot-password posts can't pile up work (and memory) behind a slow Brevo.
+EMAIL_QUEUE_LIMIT = 64
+_email_slots = threading.BoundedSemaphore(EMAIL_QUEUE_LIMIT)
+
+
+def submit_email(fn, *args) -> bool:
+    """Queue fn(*args) on the email pool; False if the queue is full."""
+    if not _email_slots.acquire(blocking=False):
+        return False
+    try:
+        fut = _EMAIL_POOL.submit(fn, *args)
+    except Exception:
+        _email_slots.release()
+        raise
+    fut.add_done_callback(lambda _f: _email_slots.release())
+    return True
 
 
 # ---------- Time helper ----------
+# Memoized: rows written by one bulk insert / in the same second share a
+# created_at, so list endpoints mostly hit the cache instead of re-running
+# the tz conversion + isoformat per row.
+@lru_cache(maxsize=4096)
 def to_eastern_iso(dt):
     if not dt:
         return None
@@ -58,99 +552,480 @@ def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
 
+ALLOWED_IMAGE_EXTS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".webp"})
+
+
 def allowed_image(filename: str) -> bool:
-    if not filename or "." not in filename:
+    if not filename:
         return False
-    ext = filename.rsplit(".", 1)[1].lower()
-    return ext in {"jpg", "jpeg", "png", "gif", "webp"}
+    return os.path.splitext(filename)[1].lower() in ALLOWED_IMAGE_EXTS
 
 
 def unique_filename(filename: str) -> str:
     name = secure_filename(filename)
-    ts = int(time.time() * 1000)
     base, ext = os.path.splitext(name)
-    return f"{base}-{ts}{ext}"
+    # random suffix: unlike a millisecond timestamp it can't collide when
+    # two uploads of the same file name land at the same moment
+    return f"{base}-{secrets.token_hex(6)}{ext}"
+
+
+# Werkzeug reads multipart bodies in 64 KiB chunks; a 16 MB image is then
+# ~256 trips through the decoder loop, 256 KiB cuts that to 64. The decoder
+# rejects any chunk larger than MAX_FORM_MEMORY_SIZE (config.py), so keep this
+# well below.
+MULTIPART_BUFFER_SIZE = 256 * 1024
+
+
+class UploadFormDataParser(FormDataParser):
+    # Mirrors Werkzeug 3.1's FormDataParser._parse_multipart, the only place
+    # MultiPartParser's buffer_size can be set (the public constructor has no
+    # such argument). Werkzeug is pinned to 3.1.x in requirements.txt; re-check
+    # this against the new version before raising the pin.
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        parser = MultiPartParser(
+            stream_factory=self.stream_factory,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.cls,
+            buffer_size=MULTIPART_BUFFER_SIZE,
+        )
+        boundary = options.get("boundary", "").encode("ascii")
+        if not boundary:
+            raise ValueError("Missing boundary")
+
+        form, files = parser.parse(stream, boundary, content_length)
+        return stream, form, files
 
 
-# ---------- Low-stock helper ----------
-def is_low_stock_product(p: Product) -> bool:
+class UploadRequest(Request):
     """
-    - If reorder_threshold > 0 and quantity <= threshold -> low
-    - OR quantity < 2 as fallback
+    Writes image parts of multipart bodies to a temp file in
+    UPLOAD_TMP_FOLDER while the body is parsed, instead of spooling them in
+    memory / /tmp first. That folder is under the (never served) instance
+    folder, so partial uploads can't be fetched by URL, but normally sits on
+    the same filesystem as the uploads folder: store_upload() then only has
+    to hard-link the file into place. Body size is capped by
+    MAX_CONTENT_LENGTH (config.py).
     """
-    threshold = getattr(p, "reorder_threshold", 0) or 0
-    qty = p.quantity or 0
-    if threshold > 0 and qty <= threshold:
-        return True
-    return qty < 2
+
+    form_data_parser_class = UploadFormDataParser
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        folder = current_app.config.get("UPLOAD_TMP_FOLDER")
+        if folder and filename and allowed_image(filename):
+            return tempfile.NamedTemporaryFile(
+                mode="w+b", dir=folder, prefix=".upload-", suffix=".part"
+            )
+        return super()._get_file_stream(
+            total_content_length, content_type, filename, content_length
+        )
+
+
+def store_upload(image_file, folder: str, fname: str):
+    """Saves an uploaded FileStorage as folder/fname."""
+    save_path = os.path.join(folder, fname)
+    stream = image_file.stream
+    tmp_name = getattr(stream, "name", None)
+    tmp_folder = current_app.config.get("UPLOAD_TMP_FOLDER")
+    if isinstance(tmp_name, str) and os.path.dirname(tmp_name) == tmp_folder:
+        stream.flush()
+        try:
+            # the temp file is unlinked when the request closes it
+            os.link(tmp_name, save_path)
+            return
+        except OSError:
+            pass  # e.g. no hard-link support; fall back to copying
+    image_file.save(save_path)
 
 
 # ---------- Low-stock scan ----------
+# The manager notifications poll rescans only when stock changed in this
+# process or the last scan is LOW_STOCK_SCAN_INTERVAL seconds old (which
+# bounds how long changes made on other gunicorn workers go unseen).
+LOW_STOCK_SCAN_INTERVAL = 30
+_scan_state = {"ts": 0.0, "dirty": True}
+
+
+def mark_low_stock_dirty():
+    _scan_state["dirty"] = True
+
+
+def maybe_run_low_stock_scan():
+    now = time.monotonic()
+    if _scan_state["dirty"] or now - _scan_state["ts"] > LOW_STOCK_SCAN_INTERVAL:
+        # reset first so a change made during the scan marks it dirty again
+        _scan_state.update(ts=now, dirty=False)
+        try:
+            run_low_stock_scan()
+        except Exception:
+            _scan_state["dirty"] = True
+            raise
+
+
+# Single-flight: a scan requested while another is running in this process
+# only sets _scan_pending; the running scan then does one more pass, which
+# sees every change committed before the request.
+_scan_lock = threading.Lock()
+_scan_pending = False
+
+
 def run_low_stock_scan():
-    managers = User.query.filter_by(role="manager").all()
-    if not managers:
-        return
+    global _scan_pending
+    _scan_pending = True
+    while _scan_pending:
+        if not _scan_lock.acquire(blocking=False):
+            return
+        try:
+            while _scan_pending:
+                _scan_pending = False
+                _scan_low_stock_once()
+        finally:
+            _scan_lock.release()
+        # loop again if a request arrived between the last pass and release
 
-    all_products = Product.query.all()
-    if not all_products:
-        return
 
-    manager_ids = [m.id for m in managers]
+def _scan_low_stock_once():
+    manager_ids = get_manager_ids()
+    if not manager_ids:
+        return
 
-    low_product_ids = set()
-    for p in all_products:
-        if is_low_stock_product(p):
-            low_product_ids.add(p.id)
+    # only low rows, as plain tuples; no Product instances are loaded
+    low_products = db.session.execute(
+        db.select(Product.id, Product.name, Product.quantity).where(
+            Product.is_low_stock
+        )
+    ).all()
+    low_product_ids = {pid for pid, _, _ in low_products}
+
+    # product_id is extracted in SQL so the JSON payload is never decoded here
+    notif_pid = Notification.payload["product_id"].as_integer()
+    manager_low_stock = db.and_(
+        Notification.type == "LOW_STOCK",
+        Notification.user_id.in_(manager_ids),
+    )
 
-    existing = (
-        Notification.query
-        .filter(Notification.type == "LOW_STOCK")
-        .filter(Notification.user_id.in_(manager_ids))
-        .all()
+    # remove LOW_STOCK for products no longer low: one set-based DELETE, so
+    # stale rows are never read back just to be deleted by id
+    db.session.execute(
+        db.delete(Notification).where(
+            manager_low_stock,
+            notif_pid.is_not(None),
+            notif_pid.not_in(low_product_ids),
+        ),
+        execution_options={"synchronize_session": False},
     )
 
+    # what survives is exactly the still-low (manager, product) pairs
     existing_map: dict[int, set[int]] = {}
+    for user_id, pid in db.session.execute(
+        db.select(Notification.user_id, notif_pid).where(
+            manager_low_stock, notif_pid.is_not(None)
+        )
+    ):
+        existing_map.setdefault(user_id, set()).add(pid)
 
-    # remove LOW_STOCK for products no longer low
-    for n in existing:
-        pid = None
-        if isinstance(n.payload, dict):
-            pid = n.payload.get("product_id")
+    # create missing LOW_STOCK
+    rows = []
+    for pid, name, qty in low_products:
+        msg = f"Low stock: {name} has only {qty} left in inventory."
+        for mid in manager_ids:
+            if pid in existing_map.get(mid, ()):
+                continue
+            rows.append(
+                {
+                    "user_id": mid,
+                    "type": "LOW_STOCK",
+                    "message": msg,
+                    "payload": {"product_id": pid, "quantity": qty},
+                    "is_read": False,
+                }
+            )
+
+    if rows:
+        db.session.execute(db.insert(Notification), rows)
+    db.session.commit()
 
-        if pid is None:
-            continue
 
-        if pid not in low_product_ids:
-            db.session.delete(n)
-            continue
+# ---------- Payload parsing ----------
+def read_json() -> dict:
+    """
+    Request body parsed with orjson, without keeping a cached copy of the
+    raw bytes on the request. Empty body -> {}.
+    """
+    # check the bytes, not Content-Length: chunked bodies don't send one
+    raw = request.get_data(cache=False)
+    if not raw:
+        return {}
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        raise BadRequest("Failed to decode JSON object")
+    return data if isinstance(data, dict) else {}
+
+
+def parse_product_payload(data):
+    """
+    Normalise a product create / bulk-import row.
+    Returns (fields, None) or (None, error message).
+    """
+    name = (data.get("name") or "").strip()
+    if not name:
+        return None, "Name is required"
+
+    try:
+        quantity = int(data.get("quantity", 0) or 0)
+        price = float(data.get("price", 0) or 0)
+        threshold = int(data.get("reorder_threshold", 0) or 0)
+    except (TypeError, ValueError):
+        return None, "quantity, price and threshold must be numeric"
+
+    return {
+        "name": name,
+        "quantity": quantity,
+        "price": price,
+        "description": (data.get("description") or "").strip(),
+        "reorder_threshold": threshold,
+        "vendor_name": (data.get("vendor_name") or "").strip() or None,
+        "vendor_contact": (data.get("vendor_contact") or "").strip() or None,
+        "category": (data.get("category") or "").strip() or None,
+    }, None
+
+
+def parse_stock_request_payload(data):
+    """
+    Returns ((product_id, quantity), None) or (None, error message).
+    """
+    try:
+        product_id = int(data.get("product_id"))
+        qty = int(data.get("quantity", 0))
+    except (TypeError, ValueError):
+        return None, "product_id and quantity must be integers"
 
-        existing_map.setdefault(n.user_id, set()).add(pid)
+    if qty <= 0:
+        return None, "Quantity must be > 0"
+    return (product_id, qty), None
 
-    # create missing LOW_STOCK
-    for p in all_products:
-        if p.id not in low_product_ids:
-            continue
 
-        for m in managers:
-            if p.id in existing_map.get(m.id, set()):
-                continue
-            msg = f"Low stock: {p.name} has only {p.quantity} left in inventory."
-            n = Notification(
-                user_id=m.id,
-                type="LOW_STOCK",
-                message=msg,
-                payload={"product_id": p.id, "quantity": p.quantity},
-                is_read=False,
+# ---------- Report queries ----------
+# Built once at import; handlers execute them with {"start": ..., "end": ...}
+# so each request only binds parameters against the cached compiled SQL.
+def approved_qty_by(*keys):
+    """
+    Subquery: SUM(quantity) of approved requests created in [:start, :end),
+    grouped by keys. It reads only ix_stock_requests_report, so the reports
+    join products once per product (per day) rather than once per request.
+    """
+    return (
+        db.select(*keys, db.func.sum(StockRequest.quantity).label("qty"))
+        .where(
+            StockRequest.status == "Approved",
+            StockRequest.created_at >= db.bindparam("start"),
+            StockRequest.created_at < db.bindparam("end"),
+        )
+        .group_by(*keys)
+        .subquery()
+    )
+
+
+_per_product = approved_qty_by(StockRequest.product_id)
+USAGE_STMT = (
+    db.select(
+        Product.id.label("product_id"),
+        Product.name.label("product_name"),
+        _per_product.c.qty.label("total_requested"),
+        db.func.coalesce(_per_product.c.qty * Product.price, 0).label("total_cost"),
+    )
+    .join(_per_product, _per_product.c.product_id == Product.id)
+    .order_by(_per_product.c.qty.desc())
+)
+
+# Cost analysis: line (per day) and breakdown (per category) are two
+# groupings of the same per-day, per-product costs, so they come back from one
+# statement. DATE(created_at) is cast to text ("YYYY-MM-DD") so both halves
+# share the key column.
+_daily = approved_qty_by(
+    db.func.date(StockRequest.created_at).label("day"), StockRequest.product_id
+)
+_daily_cost = (
+    db.select(
+        _daily.c.day,
+        Product.category,
+        (_daily.c.qty * Product.price).label("cost"),
+    )
+    .join(Product, Product.id == _daily.c.product_id)
+    .cte("daily_cost")
+)
+_cost_total = db.func.coalesce(db.func.sum(_daily_cost.c.cost), 0).label("total_cost")
+COST_ANALYSIS_STMT = db.union_all(
+    db.select(
+        db.literal("day").label("kind"),
+        db.cast(_daily_cost.c.day, db.String).label("key"),
+        _cost_total,
+    ).group_by(_daily_cost.c.day),
+    db.select(
+        db.literal("category"), _daily_cost.c.category, _cost_total
+    ).group_by(_daily_cost.c.category),
+)
+COST_ANALYSIS_STMT = COST_ANALYSIS_STMT.order_by(
+    COST_ANALYSIS_STMT.selected_columns.kind, COST_ANALYSIS_STMT.selected_columns.key
+)
+
+
+# ---------- List pagination ----------
+# Request and notification lists page newest-first on (created_at, id):
+#   ?limit=N      -> at most N items (capped at PAGE_LIMIT_MAX)
+#   ?before=<id>  -> only rows older than row <id>
+PAGE_LIMIT_MAX = 200
+
+
+def parse_limit():
+    """?limit= clamped to 1..PAGE_LIMIT_MAX; None when absent."""
+    limit = request.args.get("limit", type=int)
+    if limit is None:
+        return None
+    return min(max(limit, 1), PAGE_LIMIT_MAX)
+
+
+def newest_first(model):
+    """ORDER BY the keyset_before() cursor compares against."""
+    return (model.created_at.desc(), model.id.desc())
+
+
+def keyset_before(model, before, *scope):
+    """
+    WHERE clause for rows of model older than row `before` in (created_at, id)
+    order, spelled out for MySQL/SQLite. scope narrows the cursor lookup.
+    """
+    cursor_at = (
+        db.select(model.created_at)
+        .where(model.id == before, *scope)
+        .scalar_subquery()
+    )
+    return db.or_(
+        model.created_at < cursor_at,
+        db.and_(model.created_at == cursor_at, model.id < before),
+    )
+
+
+# ---------- Notification queries ----------
+def visible_notifications(uid, *columns):
+    """
+    select(*columns) over a user's notifications, keeping only the newest
+    LOW_STOCK row per product. The ranking is ROW_NUMBER() in SQL (MySQL 8 /
+    SQLite 3.25+); other types pass through untouched. Legacy rows without a
+    product_id are grouped by the product part of their message instead.
+    """
+    product_id = Notification.payload["product_id"].as_integer()
+    # "Low stock: X has only N left" -> "Low stock: X" (instr/substr exist in
+    # both MySQL and SQLite)
+    cut = db.func.instr(Notification.message, " has only")
+    legacy_key = db.case(
+        (product_id.is_not(None), None),
+        (cut > 0, db.func.substr(Notification.message, 1, cut - 1)),
+        else_=Notification.message,
+    )
+    ranked = (
+        db.select(
+            Notification.id,
+            db.func.row_number()
+            .over(
+                partition_by=(Notification.type, product_id, legacy_key),
+                order_by=(Notification.created_at.desc(), Notification.id.desc()),
             )
-            db.session.add(n)
-            existing_map.setdefault(m.id, set()).add(p.id)
+            .label("rn"),
+        )
+        .where(Notification.user_id == uid)
+        .subquery()
+    )
+    return (
+        db.select(*columns)
+        .join(ranked, ranked.c.id == Notification.id)
+        .where(
+            db.or_(Notification.type != "LOW_STOCK", ranked.c.rn == 1)
+        )
+    )
 
-    db.session.commit()
+
+# ---------- Stock request loading ----------
+# Edit / delete only touch a request's own scalar columns.
+# raiseload makes any lazy relationship access fail loudly instead of adding
+# a hidden query per call.
+STOCK_REQUEST_WRITE_OPTIONS = (
+    db.load_only(
+        StockRequest.id,
+        StockRequest.product_id,
+        StockRequest.requested_by,
+        StockRequest.quantity,
+        StockRequest.status,
+    ),
+    db.raiseload("*"),
+)
+
+
+# Approve / deny need the request's scalars plus the product name: one
+# LEFT JOIN instead of a request load followed by a product lookup.
+REQUEST_DECISION_STMT = (
+    db.select(
+        StockRequest.product_id,
+        StockRequest.requested_by,
+        StockRequest.quantity,
+        StockRequest.status,
+        Product.name,
+    )
+    .outerjoin(Product, Product.id == StockRequest.product_id)
+    .where(StockRequest.id == db.bindparam("rid"))
+)
+
+
+# ---------- Stock request notifications ----------
+def notify_managers_of_requests(requester_id, created):
+    """
+    Queue a REQUEST_CREATED notification for every manager.
+    created: list of (request_id, product_id, product_name, quantity)
+    """
+    manager_ids = get_manager_ids()
+    if not manager_ids:
+        return
+
+    requester = db.session.execute(
+        db.select(User.name, User.username).where(User.id == requester_id)
+    ).first()
+    requester_name = (requester.name or "").strip() if requester else None
+    if not requester_name and requester:
+        requester_name = requester.username
+    if not requester_name:
+        requester_name = "Unknown user"
+
+    rows = []
+    for request_id, product_id, product_name, qty in created:
+        msg = f"New stock request from {requester_name}: {qty} × {product_name}."
+        payload = {
+            "request_id": request_id,
+            "product_id": product_id,
+            "quantity": qty,
+        }
+        for mid in manager_ids:
+            rows.append(
+                {
+                    "user_id": mid,
+                    "type": "REQUEST_CREATED",
+                    "message": msg,
+                    "payload": payload,
+                    "is_read": False,
+                }
+            )
+
+    # one executemany instead of an ORM INSERT per notification
+    db.session.execute(db.insert(Notification), rows)
 
 
 # ---------- App factory ----------
 def create_app():
     app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.json = OrjsonProvider(app)
     app.config.from_object(Config)
 
     # token serializer for password reset
@@ -160,57 +1035,49 @@ def create_app():
     def send_password_reset_email(email: str, token: str):
         reset_link = f"{BASE_URL}/reset-password?token={token}"
 
-        # log link for debugging
-        print("Password reset link for debugging:", reset_link)
+        # log link for debugging (shown when FLASK_DEBUG=1)
+        app.logger.debug("Password reset link for debugging: %s", reset_link)
 
         if not BREVO_API_KEY:
-            print("BREVO_API_KEY is not set – skipping Brevo send.")
+            app.logger.warning("BREVO_API_KEY is not set – skipping Brevo send.")
             return
 
         try:
-            url = "https://api.brevo.com/v3/smtp/email"
-            headers = {
-                "accept": "application/json",
-                "api-key": BREVO_API_KEY,
-                "content-type": "application/json",
-            }
             payload = {
-                "sender": {
-                    "name": BREVO_SENDER_NAME,
-                    "email": BREVO_SENDER_EMAIL,
-                },
+                **BREVO_RESET_TEMPLATE,
                 "to": [{"email": email}],
-                "subject": "FogonIMS – Password Reset",
-                "textContent": (
-                    "Hi,\n\n"
-                    "We received a request to reset your FogonIMS password.\n\n"
-                    f"Click the link below to reset it:\n{reset_link}\n\n"
-                    "If you didn't request this, you can ignore this email.\n"
-                ),
+                "textContent": RESET_EMAIL_TEXT.format(link=reset_link),
             }
-            resp = http_requests.post(url, headers=headers, json=payload, timeout=10)
+            # session headers already carry content-type: application/json
+            resp = _BREVO_SESSION.post(
+                BREVO_EMAIL_URL, data=orjson.dumps(payload), timeout=10
+            )
             if resp.status_code >= 400:
-                print("Brevo error:", resp.status_code, resp.text)
+                app.logger.error("Brevo error: %s %s", resp.status_code, resp.text)
             else:
-                print("Password reset email sent via Brevo:", email)
-        except Exception as e:
-            print("Error calling Brevo API:", e)
+                app.logger.info("Password reset email sent via Brevo: %s", email)
+        except Exception:
+            app.logger.exception("Error calling Brevo API")
 
     # uploads
     upload_folder = os.path.join(app.root_path, "static", "uploads")
     ensure_dir(upload_folder)
     app.config["UPLOAD_FOLDER"] = upload_folder
-    app.config.setdefault("MAX_CONTENT_LENGTH", 16 * 1024 * 1024)
+    # in-progress upload parts (see UploadRequest); outside static/
+    upload_tmp_folder = os.path.join(app.instance_path, "upload-tmp")
+    ensure_dir(upload_tmp_folder)
+    app.config["UPLOAD_TMP_FOLDER"] = upload_tmp_folder
 
     db.init_app(app)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    CORS(app, resources=API_CORS_RESOURCES)
+    Compress(app)
     JWTManager(app)
 
     login_manager = LoginManager(app)
 
     @login_manager.user_loader
     def load_user(uid):
-        return User.query.get(int(uid))
+        return get_session_user(int(uid))
 
     # ---------- Root & static ----------
     @app.route("/")
@@ -224,20 +1091,18 @@ def create_app():
     # ---------- Auth API (used by mobile app) ----------
     @app.post("/api/login")
     def api_login():
-        data = request.get_json() or {}
+        data = read_json()
         username = (data.get("username") or "").strip()
         password = data.get("password") or ""
 
-        user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
-            token = create_access_token(
-                identity=user.username,
-                additional_claims={
-                    "id": user.id,
-                    "role": user.role,
-                    "name": user.name,
-                },
-            )
+        # only what the token/response needs; username is uniquely indexed
+        user = db.session.execute(
+            db.select(
+                User.id, User.username, User.name, User.role, User.password_hash
+            ).where(User.username == username)
+        ).first()
+        if user and check_password_pooled(user.password_hash, password):
+            token = issue_access_token(user)
             return (
                 jsonify(
                     {
@@ -253,7 +1118,7 @@ def create_app():
 
     @app.post("/api/register")
     def api_register():
-        data = request.get_json() or {}
+        data = read_json()
 
         username = (data.get("username") or "").strip()
         name = (data.get("name") or "").strip()
@@ -269,10 +1134,14 @@ def create_app():
         if role not in ("cook", "manager"):
             return jsonify({"error": "role must be 'cook' or 'manager'"}), 400
 
-        if User.query.filter_by(username=username).first():
+        # one round trip for both uniqueness checks; the DB compares (with its
+        # collation) and reports per clashing row whether it was the username
+        username_clash = User.username == username
+        clash = db.or_(username_clash, User.email == email) if email else username_clash
+        taken = db.session.scalars(db.select(username_clash).where(clash)).all()
+        if any(taken):
             return jsonify({"error": "Username already exists"}), 400
-
-        if email and User.query.filter_by(email=email).first():
+        if taken:
             return jsonify({"error": "Email already exists"}), 400
 
         u = User(
@@ -281,19 +1150,14 @@ def create_app():
             email=email or None,
             role=role,
         )
-        u.set_password(password)
+        u.password_hash = hash_password_pooled(password)
 
         db.session.add(u)
         db.session.commit()
+        if role == "manager":
+            forget_manager_ids()
 
-        token = create_access_token(
-            identity=u.username,
-            additional_claims={
-                "id": u.id,
-                "role": u.role,
-                "name": u.name,
-            },
-        )
+        token = issue_access_token(u)
 
         return (
             jsonify(
@@ -309,6 +1173,23 @@ def create_app():
             201,
         )
 
+    # ---------- Pre-rendered HTML pages ----------
+    # These pages never change at runtime, so they're rendered to bytes once.
+    # The reset form is split around its token so each GET is one concat.
+    def render_page_bytes(name: str, **context) -> bytes:
+        return app.jinja_env.get_template(name).render(**context).encode()
+
+    web_login_success_page = render_page_bytes("web_login_success.html")
+    reset_success_page = render_page_bytes(
+        "reset_password_success.html", login_url=LOGIN_PAGE_URL
+    )
+    reset_form_head, reset_form_tail = render_page_bytes(
+        "reset_password.html", token="__TOKEN__"
+    ).split(b"__TOKEN__")
+
+    def html_response(body: bytes):
+        return app.response_class(body, mimetype="text/html")
+
     # ---------- HTML login page (for after reset) ----------
     @app.route("/login-page", methods=["GET", "POST"])
     def web_login_page():
@@ -318,194 +1199,30 @@ def create_app():
             username = (request.form.get("username") or "").strip()
             password = request.form.get("password") or ""
 
-            user = User.query.filter_by(username=username).first()
-            if user and user.check_password(password):
+            password_hash = db.session.scalar(
+                db.select(User.password_hash).where(User.username == username)
+            )
+            if password_hash and check_password_pooled(password_hash, password):
                 # Just show a success message – this login is for confirming
                 # the new password, not for the mobile app.
-                success_html = """
-                <!doctype html>
-                <html>
-                <head>
-                  <meta charset="utf-8">
-                  <title>Login successful – FogonIMS</title>
-                  <meta name="viewport" content="width=device-width, initial-scale=1">
-                  <style>
-                    body {
-                      margin: 0;
-                      padding: 0;
-                      font-family: -apple-system, BlinkMacSystemFont, "SF Pro Text",
-                        system-ui, sans-serif;
-                      background: linear-gradient(135deg, #f97316, #facc15);
-                      display: flex;
-                      align-items: center;
-                      justify-content: center;
-                      min-height: 100vh;
-                    }
-                    .card {
-                      background: #ffffff;
-                      padding: 28px 24px;
-                      border-radius: 20px;
-                      box-shadow: 0 18px 40px rgba(0, 0, 0, 0.16);
-                      max-width: 420px;
-                      width: 100%;
-                      box-sizing: border-box;
-                    }
-                    h1 {
-                      margin: 0 0 8px 0;
-                      font-size: 1.6rem;
-                      color: #111827;
-                    }
-                    .success {
-                      padding: 10px 12px;
-                      border-radius: 12px;
-                      background: #ecfdf5;
-                      color: #166534;
-                      font-size: 0.9rem;
-                      border: 1px solid #bbf7d0;
-                    }
-                    p {
-                      margin-top: 10px;
-                      font-size: 0.9rem;
-                      color: #4b5563;
-                    }
-                  </style>
-                </head>
-                <body>
-                  <div class="card">
-                    <h1>Login successful</h1>
-                    <div class="success">
-                      You are logged in with your new password. You can now return to the FogonIMS mobile app and use these credentials.
-                    </div>
-                    <p>You may close this tab or window.</p>
-                  </div>
-                </body>
-                </html>
-                """
-                return render_template_string(success_html)
+                return html_response(web_login_success_page)
 
             else:
                 error = "Invalid username or password."
 
-        login_html = """
-        <!doctype html>
-        <html>
-        <head>
-          <meta charset="utf-8">
-          <title>Login – FogonIMS</title>
-          <meta name="viewport" content="width=device-width, initial-scale=1">
-          <style>
-            body {
-              margin: 0;
-              padding: 0;
-              font-family: -apple-system, BlinkMacSystemFont, "SF Pro Text",
-                system-ui, sans-serif;
-              background: linear-gradient(135deg, #f97316, #facc15);
-              display: flex;
-              align-items: center;
-              justify-content: center;
-              min-height: 100vh;
-            }
-            .card {
-              background: #ffffff;
-              padding: 28px 24px;
-              border-radius: 20px;
-              box-shadow: 0 18px 40px rgba(0, 0, 0, 0.16);
-              max-width: 420px;
-              width: 100%;
-              box-sizing: border-box;
-            }
-            h1 {
-              margin: 0 0 6px 0;
-              font-size: 1.6rem;
-              color: #111827;
-            }
-            p.sub {
-              margin: 0 0 20px 0;
-              font-size: 0.9rem;
-              color: #6b7280;
-            }
-            label {
-              font-size: 0.82rem;
-              color: #374151;
-              display: block;
-              margin-bottom: 4px;
-            }
-            input[type="text"],
-            input[type="password"] {
-              width: 100%;
-              padding: 9px 10px;
-              border-radius: 10px;
-              border: 1px solid #d1d5db;
-              font-size: 0.9rem;
-              box-sizing: border-box;
-            }
-            input[type="text"]:focus,
-            input[type="password"]:focus {
-              outline: none;
-              border-color: #f97316;
-              box-shadow: 0 0 0 1px rgba(249,115,22,0.2);
-            }
-            .field {
-              margin-bottom: 14px;
-            }
-            button {
-              margin-top: 6px;
-              width: 100%;
-              padding: 10px 14px;
-              border-radius: 999px;
-              border: none;
-              background: #f97316;
-              color: white;
-              font-size: 0.95rem;
-              font-weight: 500;
-            }
-            .error {
-              margin-bottom: 10px;
-              padding: 8px 10px;
-              border-radius: 10px;
-              background: #fef2f2;
-              color: #b91c1c;
-              border: 1px solid #fecaca;
-              font-size: 0.85rem;
-            }
-          </style>
-        </head>
-        <body>
-          <div class="card">
-            <h1>Log in to FogonIMS</h1>
-            <p class="sub">Use the same username and password as in the FogonIMS mobile app.</p>
-            {% if error %}
-              <div class="error">{{ error }}</div>
-            {% endif %}
-            <form method="POST">
-              <div class="field">
-                <label>Username</label>
-                <input type="text" name="username" required>
-              </div>
-              <div class="field">
-                <label>Password</label>
-                <input type="password" name="password" required>
-              </div>
-              <button type="submit">Login</button>
-            </form>
-          </div>
-        </body>
-        </html>
-        """
-        return render_template_string(login_html, error=error)
+        return render_template("web_login.html", error=error)
 
     # ----- start password reset -----
     @app.post("/api/password/forgot")
     def api_password_forgot():
-        data = request.get_json() or {}
+        data = read_json()
         email = (data.get("email") or "").strip().lower()
 
         if not email:
             return jsonify({"error": "Email is required"}), 400
 
-        user = (
-            User.query.filter(db.func.lower(User.email) == email)
-            .first()
+        user = db.session.scalar(
+            db.select(User).where(db.func.lower(User.email) == email).limit(1)
         )
 
         if not user:
@@ -515,9 +1232,12 @@ def create_app():
         token = serializer.dumps({"uid": user.id})
 
         try:
-            send_password_reset_email(user.email, token)
-        except Exception as e:
-            print("Error sending reset email:", e)
+            if not submit_email(send_password_reset_email, user.email, token):
+                app.logger.warning(
+                    "Email queue full – dropping reset email for %s", user.email
+                )
+        except Exception:
+            app.logger.exception("Error sending reset email")
 
         return jsonify({"ok": True}), 200
 
@@ -537,7 +1257,7 @@ def create_app():
         except BadSignature:
             return "Invalid password reset token.", 400
 
-        user = User.query.get(uid)
+        user = db.session.get(User, uid)
         if not user:
             return "User not found.", 404
 
@@ -550,177 +1270,17 @@ def create_app():
             if new_password != confirm:
                 return "Passwords do not match.", 400
 
-            user.set_password(new_password)
+            user.password_hash = hash_password_pooled(new_password)
             db.session.commit()
+            forget_session_user(user.id)
 
             # ✅ SUCCESS PAGE POINTS TO LOGIN_PAGE_URL NOW
-            success_html = """
-            <!doctype html>
-            <html>
-            <head>
-              <meta charset="utf-8">
-              <title>Password Reset – FogonIMS</title>
-              <meta name="viewport" content="width=device-width, initial-scale=1">
-              <style>
-                body {
-                  margin: 0;
-                  padding: 0;
-                  font-family: -apple-system, BlinkMacSystemFont, "SF Pro Text",
-                    system-ui, sans-serif;
-                  background: linear-gradient(135deg, #f97316, #facc15);
-                  display: flex;
-                  align-items: center;
-                  justify-content: center;
-                  min-height: 100vh;
-                }
-                .card {
-                  background: #ffffff;
-                  padding: 28px 24px;
-                  border-radius: 20px;
-                  box-shadow: 0 18px 40px rgba(0, 0, 0, 0.16);
-                  max-width: 420px;
-                  width: 100%;
-                }
-                h1 {
-                  margin: 0 0 8px 0;
-                  font-size: 1.6rem;
-                  color: #111827;
-                }
-                .success {
-                  padding: 10px 12px;
-                  border-radius: 12px;
-                  background: #ecfdf5;
-                  color: #166534;
-                  font-size: 0.9rem;
-                  border: 1px solid #bbf7d0;
-                }
-                a.btn {
-                  display: inline-block;
-                  margin-top: 18px;
-                  padding: 10px 16px;
-                  border-radius: 999px;
-                  background: #f97316;
-                  color: #ffffff;
-                  text-decoration: none;
-                  font-size: 0.9rem;
-                  font-weight: 500;
-                }
-              </style>
-            </head>
-            <body>
-              <div class="card">
-                <h1>Password reset successful</h1>
-                <div class="success">
-                  Your password has been updated. You can now log in with your new credentials in the FogonIMS app.
-                </div>
-                <a href="{{ login_url }}" class="btn">Back to Login page</a>
-              </div>
-            </body>
-            </html>
-            """
-            return render_template_string(success_html, login_url=LOGIN_PAGE_URL)
+            return html_response(reset_success_page)
 
         # GET -> show form
-        html = """
-        <!doctype html>
-        <html>
-        <head>
-          <meta charset="utf-8">
-          <title>Reset Password – FogonIMS</title>
-          <meta name="viewport" content="width=device-width, initial-scale=1">
-          <style>
-            body {
-              margin: 0;
-              padding: 0;
-              font-family: -apple-system, BlinkMacSystemFont, "SF Pro Text",
-                system-ui, sans-serif;
-              background: linear-gradient(135deg, #f97316, #facc15);
-              display: flex;
-              align-items: center;
-              justify-content: center;
-              min-height: 100vh;
-            }
-            .card {
-              background: #ffffff;
-              padding: 28px 24px;
-              border-radius: 20px;
-              box-shadow: 0 18px 40px rgba(0, 0, 0, 0.16);
-              max-width: 420px;
-              width: 100%;
-              box-sizing: border-box;
-            }
-            h1 {
-              margin: 0 0 6px 0;
-              font-size: 1.6rem;
-              color: #111827;
-            }
-            p.sub {
-              margin: 0 0 20px 0;
-              font-size: 0.9rem;
-              color: #6b7280;
-            }
-            label {
-              font-size: 0.82rem;
-              color: #374151;
-              display: block;
-              margin-bottom: 4px;
-            }
-            input[type="password"] {
-              width: 100%;
-              padding: 9px 10px;
-              border-radius: 10px;
-              border: 1px solid #d1d5db;
-              font-size: 0.9rem;
-              box-sizing: border-box;
-            }
-            input[type="password"]:focus {
-              outline: none;
-              border-color: #f97316;
-              box-shadow: 0 0 0 1px rgba(249,115,22,0.2);
-            }
-            .field {
-              margin-bottom: 14px;
-            }
-            button {
-              margin-top: 6px;
-              width: 100%;
-              padding: 10px 14px;
-              border-radius: 999px;
-              border: none;
-              background: #f97316;
-              color: white;
-              font-size: 0.95rem;
-              font-weight: 500;
-            }
-            .hint {
-              margin-top: 8px;
-              font-size: 0.8rem;
-              color: #9ca3af;
-            }
-          </style>
-        </head>
-        <body>
-          <div class="card">
-            <h1>Reset your password</h1>
-            <p class="sub">Choose a new password for your FogonIMS account.</p>
-            <form method="POST">
-              <input type="hidden" name="token" value="{{ token }}">
-              <div class="field">
-                <label>New password</label>
-                <input type="password" name="password" required>
-              </div>
-              <div class="field">
-                <label>Confirm password</label>
-                <input type="password" name="confirm" required>
-              </div>
-              <button type="submit">Update password</button>
-              <p class="hint">After resetting, you can go to the login page and sign in with your new password.</p>
-            </form>
-          </div>
-        </body>
-        </html>
-        """
-        return render_template_string(html, token=token)
+        return html_response(
+            reset_form_head + escape(token).encode() + reset_form_tail
+        )
 
     @app.get("/api/me")
     @jwt_required()
@@ -732,7 +1292,7 @@ def create_app():
                 {
                     "id": claims.get("id"),
                     "username": username,
-                    "role": claims.get("role"),
+                    "role": ROLE_NAMES.get(token_role(claims)),
                     "name": claims.get("name"),
                 }
             ),
@@ -741,103 +1301,80 @@ def create_app():
 
     # ---------- Products ----------
     @app.get("/api/products")
-    @jwt_required()
+    @cached_jwt_required()
     def api_products_list():
         """
         Optional query:
           ?filter=low  -> return only low-stock items
+        Accept: application/x-ndjson streams one product per line instead
+        of a JSON array.
         """
         filter_param = (request.args.get("filter") or "").lower()
+        cache_key = "low" if filter_param == "low" else "all"
 
-        q = Product.query
+        # plain column tuples: no ORM instances / identity map for the list
+        stmt = db.select(*PRODUCT_ROW_COLUMNS).order_by(db.func.lower(Product.name))
         if filter_param == "low":
-            all_items = q.all()
-            filtered = [p for p in all_items if is_low_stock_product(p)]
-        else:
-            filtered = q.all()
+            stmt = stmt.where(Product.is_low_stock)
+
+        if request.accept_mimetypes.best == "application/x-ndjson":
+            # one product object per line, read through a server-side cursor:
+            # memory stays flat however large the catalog gets
+            def generate():
+                for row in db.session.execute(
+                    stmt.execution_options(yield_per=500)
+                ):
+                    yield product_fragment(row) + b"\n"
+
+            return current_app.response_class(
+                stream_with_context(generate()), mimetype="application/x-ndjson"
+            )
 
-        filtered.sort(key=lambda p: (p.name or "").lower())
+        with _products_cache_lock:
+            ver = _products_cache["ver"]
+            cached = _products_cache["bytes"].get(cache_key)
+        if cached is not None:
+            return conditional_json(*cached)
 
-        result = []
-        for p in filtered:
-            threshold = getattr(p, "reorder_threshold", 0) or 0
-            is_low = is_low_stock_product(p)
-            result.append(
-                {
-                    "id": p.id,
-                    "name": p.name,
-                    "quantity": p.quantity,
-                    "price": float(p.price or 0),
-                    "description": p.description or "",
-                    "image_url": getattr(p, "image_url", None),
-                    "reorder_threshold": threshold,
-                    "is_low_stock": is_low,
-                    "vendor_name": getattr(p, "vendor_name", None),
-                    "vendor_contact": getattr(p, "vendor_contact", None),
-                    "category": getattr(p, "category", None),
-                }
-            )
-        return jsonify(result), 200
+        rows = db.session.execute(stmt).all()
+
+        frags = [product_fragment(row) for row in rows]
+        if filter_param != "low":
+            prune_product_fragments({row[0] for row in rows})
+
+        body = b"[" + b",".join(frags) + b"]\n"
+        etag = body_etag(body)
+        with _products_cache_lock:
+            # don't store a body built while a write bumped the version
+            if _products_cache["ver"] == ver:
+                _products_cache["bytes"][cache_key] = (body, etag)
+        return conditional_json(body, etag)
 
     @app.get("/api/products/<int:pid>")
     @jwt_required()
     def api_products_read_one(pid: int):
-        p = Product.query.get(pid)
-        if not p:
+        row = db.session.execute(
+            db.select(*PRODUCT_ROW_COLUMNS).where(Product.id == pid)
+        ).first()
+        if row is None:
             return jsonify({"error": "Product not found"}), 404
 
-        threshold = getattr(p, "reorder_threshold", 0) or 0
-        is_low = is_low_stock_product(p)
-
-        return (
-            jsonify(
-                {
-                    "id": p.id,
-                    "name": p.name,
-                    "quantity": p.quantity,
-                    "price": float(p.price or 0),
-                    "description": p.description or "",
-                    "image_url": getattr(p, "image_url", None),
-                    "reorder_threshold": threshold,
-                    "is_low_stock": is_low,
-                    "vendor_name": getattr(p, "vendor_name", None),
-                    "vendor_contact": getattr(p, "vendor_contact", None),
-                    "category": getattr(p, "category", None),
-                }
-            ),
-            200,
+        return current_app.response_class(
+            product_fragment(row) + b"\n", mimetype="application/json"
         )
 
     @app.post("/api/products")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only 'manager' can add products")
     def api_products_create():
-        username = (get_jwt_identity() or "").lower()
-        role = (get_jwt().get("role") or "").lower()
-        if not (username == "manager" or role == "manager"):
-            return jsonify({"error": "Only 'manager' can add products"}), 403
-
         is_multipart = (
             request.content_type and "multipart/form-data" in request.content_type
         )
-        data = request.form if is_multipart else (request.get_json() or {})
+        data = request.form if is_multipart else read_json()
 
-        name = (data.get("name") or "").strip()
-        if not name:
-            return jsonify({"error": "Name is required"}), 400
-
-        try:
-            quantity = int(data.get("quantity", 0) or 0)
-            price = float(data.get("price", 0) or 0)
-            threshold = int(data.get("reorder_threshold", 0) or 0)
-        except Exception:
-            return jsonify(
-                {"error": "quantity, price and threshold must be numeric"}
-            ), 400
-
-        description = (data.get("description") or "").strip()
-        vendor_name = (data.get("vendor_name") or "").strip() or None
-        vendor_contact = (data.get("vendor_contact") or "").strip() or None
-        category = (data.get("category") or "").strip() or None
+        fields, error = parse_product_payload(data)
+        if error:
+            return jsonify({"error": error}), 400
 
         image_url = None
         if is_multipart:
@@ -846,91 +1383,54 @@ def create_app():
                 if not allowed_image(image_file.filename):
                     return jsonify({"error": "Unsupported image type"}), 400
                 fname = unique_filename(image_file.filename)
-                save_path = os.path.join(app.config["UPLOAD_FOLDER"], fname)
-                image_file.save(save_path)
+                store_upload(image_file, app.config["UPLOAD_FOLDER"], fname)
                 image_url = f"/static/uploads/{fname}"
 
-        p = Product(
-            name=name,
-            quantity=quantity,
-            price=price,
-            description=description,
-            image_url=image_url,
-            reorder_threshold=threshold,
-            vendor_name=vendor_name,
-            vendor_contact=vendor_contact,
-            category=category,
-        )
+        p = Product(image_url=image_url, **fields)
         db.session.add(p)
         db.session.commit()
+        invalidate_products_cache()
         return jsonify({"ok": True, "id": p.id, "image_url": p.image_url}), 201
 
     @app.post("/api/products/bulk")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only 'manager' can bulk import products")
     def api_products_bulk_import():
-        username = (get_jwt_identity() or "").lower()
-        role = (get_jwt().get("role") or "").lower()
-        if not (username == "manager" or role == "manager"):
-            return jsonify({"error": "Only 'manager' can bulk import products"}), 403
-
-        payload = request.get_json() or {}
+        payload = read_json()
         items = payload.get("items") or []
         if not isinstance(items, list) or not items:
             return jsonify({"error": "items[] is required"}), 400
 
-        created = []
+        rows = []
         for row in items:
-            name = (row.get("name") or "").strip()
-            if not name:
+            fields, error = parse_product_payload(row)
+            if error:
                 continue
-
-            try:
-                quantity = int(row.get("quantity", 0) or 0)
-                price = float(row.get("price", 0) or 0)
-                threshold = int(row.get("reorder_threshold", 0) or 0)
-            except Exception:
-                continue
-
-            description = (row.get("description") or "").strip()
-            vendor_name = (row.get("vendor_name") or "").strip() or None
-            vendor_contact = (row.get("vendor_contact") or "").strip() or None
-            category = (row.get("category") or "").strip() or None
-
-            p = Product(
-                name=name,
-                quantity=quantity,
-                price=price,
-                description=description,
-                reorder_threshold=threshold,
-                vendor_name=vendor_name,
-                vendor_contact=vendor_contact,
-                category=category,
+            rows.append(fields)
+
+        ids = []
+        if rows:
+            # one multi-row INSERT instead of a flush per Product; MySQL has
+            # no RETURNING, so ids are read back by the (unique) name
+            db.session.execute(db.insert(Product), rows)
+            names = [r["name"] for r in rows]
+            id_by_name = dict(
+                db.session.execute(
+                    db.select(Product.name, Product.id).where(Product.name.in_(names))
+                ).all()
             )
-            db.session.add(p)
-            created.append(p)
+            ids = [id_by_name[n] for n in names]
 
         db.session.commit()
+        invalidate_products_cache()
 
-        return (
-            jsonify(
-                {
-                    "ok": True,
-                    "count": len(created),
-                    "ids": [p.id for p in created],
-                }
-            ),
-            201,
-        )
+        return jsonify({"ok": True, "count": len(ids), "ids": ids}), 201
 
     @app.put("/api/products/<int:pid>")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only 'manager' can edit products")
     def api_products_update(pid: int):
-        username = (get_jwt_identity() or "").lower()
-        role = (get_jwt().get("role") or "").lower()
-        if not (username == "manager" or role == "manager"):
-            return jsonify({"error": "Only 'manager' can edit products"}), 403
-
-        p = Product.query.get(pid)
+        p = db.session.get(Product, pid)
         if not p:
             return jsonify({"error": "Product not found"}), 404
 
@@ -942,21 +1442,20 @@ def create_app():
             payload = request.form
             image_file = request.files.get("image")
         else:
-            payload = request.get_json() or {}
+            payload = read_json()
             image_file = None
 
-        new_image_url = getattr(p, "image_url", None)
+        new_image_url = p.image_url
 
         if image_file and image_file.filename:
             if not allowed_image(image_file.filename):
                 return jsonify({"error": "Unsupported image type"}), 400
 
             fname = unique_filename(image_file.filename)
-            save_path = os.path.join(app.config["UPLOAD_FOLDER"], fname)
-            image_file.save(save_path)
+            store_upload(image_file, app.config["UPLOAD_FOLDER"], fname)
             new_image_url = f"/static/uploads/{fname}"
 
-            old_url = getattr(p, "image_url", None)
+            old_url = p.image_url
             if old_url:
                 try:
                     old_path = os.path.join(app.root_path, old_url.strip("/"))
@@ -973,29 +1472,20 @@ def create_app():
             p.quantity = int(payload.get("quantity", p.quantity))
             p.price = float(payload.get("price", p.price or 0))
             p.reorder_threshold = int(
-                payload.get(
-                    "reorder_threshold",
-                    getattr(p, "reorder_threshold", 0) or 0,
-                )
+                payload.get("reorder_threshold", p.reorder_threshold or 0)
             )
             p.vendor_name = (
-                (payload.get("vendor_name", getattr(p, "vendor_name", "") or "") or "")
+                (payload.get("vendor_name", p.vendor_name or "") or "")
                 .strip()
                 or None
             )
             p.vendor_contact = (
-                (
-                    payload.get(
-                        "vendor_contact",
-                        getattr(p, "vendor_contact", "") or "",
-                    )
-                    or ""
-                )
+                (payload.get("vendor_contact", p.vendor_contact or "") or "")
                 .strip()
                 or None
             )
             p.category = (
-                (payload.get("category", getattr(p, "category", "") or "") or "")
+                (payload.get("category", p.category or "") or "")
                 .strip()
                 or None
             )
@@ -1006,6 +1496,7 @@ def create_app():
             ), 400
 
         db.session.commit()
+        invalidate_products_cache()
         return jsonify({"ok": True, "id": p.id, "image_url": p.image_url}), 200
 
     # ---------- NEW cook consume endpoint ----------
@@ -1017,29 +1508,61 @@ def create_app():
         Body: { "quantity": 3 }
         """
         claims = get_jwt()
-        role = (claims.get("role") or "").lower()
+        role = token_role(claims)
 
         # if you want managers to also use this, remove this check
-        if role == "manager":
+        if role == ROLE_MANAGER:
             return jsonify(
                 {"error": "Managers should edit quantity from Edit Product screen."}
             ), 403
 
-        p = Product.query.get(pid)
-        if not p:
-            return jsonify({"error": "Product not found"}), 404
+        # a valid body needs no lookup (the UPDATE's rowcount tells), but a
+        # bad body for a missing product is still a 404, as the existence
+        # check used to come first
+        def product_missing():
+            return (
+                db.session.scalar(
+                    db.select(db.literal(True)).where(Product.id == pid)
+                )
+                is None
+            )
 
-        data = request.get_json() or {}
+        try:
+            data = read_json()
+        except BadRequest:
+            if product_missing():
+                return jsonify({"error": "Product not found"}), 404
+            raise
+
+        error = None
         try:
             qty = int(data.get("quantity", 0))
         except Exception:
-            return jsonify({"error": "quantity must be an integer"}), 400
-
-        if qty <= 0:
-            return jsonify({"error": "Quantity must be > 0"}), 400
-
-        current_qty = p.quantity or 0
-        if qty > current_qty:
+            error = "quantity must be an integer"
+        else:
+            if qty <= 0:
+                error = "Quantity must be > 0"
+        if error:
+            if product_missing():
+                return jsonify({"error": "Product not found"}), 404
+            return jsonify({"error": error}), 400
+
+        # check and decrement in one statement so concurrent consumes can't
+        # both pass the stock check (MySQL has no RETURNING; read back below)
+        current = db.func.coalesce(Product.quantity, 0)
+        result = db.session.execute(
+            db.update(Product)
+            .where(Product.id == pid, current >= qty)
+            .values(quantity=current - qty),
+            execution_options={"synchronize_session": False},
+        )
+        if result.rowcount == 0:
+            current_qty = db.session.scalar(
+                db.select(current).where(Product.id == pid)
+            )
+            db.session.rollback()
+            if current_qty is None:
+                return jsonify({"error": "Product not found"}), 404
             return (
                 jsonify(
                     {
@@ -1049,35 +1572,36 @@ def create_app():
                 400,
             )
 
-        p.quantity = current_qty - qty
+        new_qty, threshold = db.session.execute(
+            db.select(Product.quantity, Product.reorder_threshold).where(
+                Product.id == pid
+            )
+        ).one()
         db.session.commit()
-
-        is_low = is_low_stock_product(p)
+        invalidate_products_cache()
 
         return (
             jsonify(
                 {
-                    "id": p.id,
-                    "quantity": p.quantity,
-                    "is_low_stock": is_low,
+                    "id": pid,
+                    "quantity": new_qty,
+                    "is_low_stock": is_low_stock(new_qty, threshold),
                 }
             ),
             200,
         )
 
     @app.delete("/api/products/<int:pid>")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only 'manager' can delete products")
     def api_products_delete(pid: int):
-        username = (get_jwt_identity() or "").lower()
-        role = (get_jwt().get("role") or "").lower()
-        if not (username == "manager" or role == "manager"):
-            return jsonify({"error": "Only 'manager' can delete products"}), 403
-
-        p = Product.query.get(pid)
+        p = db.session.get(
+            Product, pid, options=[db.load_only(Product.id, Product.image_url)]
+        )
         if not p:
             return jsonify({"error": "Product not found"}), 404
 
-        if getattr(p, "image_url", None):
+        if p.image_url:
             try:
                 path = os.path.join(app.root_path, p.image_url.strip("/"))
                 if os.path.isfile(path):
@@ -1087,93 +1611,165 @@ def create_app():
 
         db.session.delete(p)
         db.session.commit()
+        invalidate_products_cache()
         return jsonify({"ok": True, "id": pid}), 200
 
     # ---------- Stock Requests ----------
     @app.post("/api/requests")
-    @jwt_required()
+    @cached_jwt_required()
     def api_stock_request():
         claims = get_jwt()
         uid = claims.get("id")
         username = (get_jwt_identity() or "").lower()
-        role = (claims.get("role") or "").lower()
+        role = token_role(claims)
 
-        if username == "manager" or role == "manager":
+        if username == "manager" or role == ROLE_MANAGER:
             return jsonify({"error": "Managers cannot request products"}), 403
 
-        data = request.get_json() or {}
-        try:
-            product_id = int(data.get("product_id"))
-            qty = int(data.get("quantity", 0))
-        except Exception:
-            return jsonify({"error": "product_id and quantity must be integers"}), 400
-
-        if qty <= 0:
-            return jsonify({"error": "Quantity must be > 0"}), 400
+        parsed, error = parse_stock_request_payload(read_json())
+        if error:
+            return jsonify({"error": error}), 400
+        product_id, qty = parsed
 
-        product = Product.query.get(product_id)
-        if not product:
+        # only the name is needed (for the notification text); skip the full row
+        product_name = db.session.scalar(
+            db.select(Product.name).where(Product.id == product_id)
+        )
+        if product_name is None:
             return jsonify({"error": "Product not found"}), 404
 
         sr = StockRequest(product_id=product_id, requested_by=uid, quantity=qty)
         db.session.add(sr)
         db.session.flush()
 
-        managers = User.query.filter_by(role="manager").all()
-        requester = User.query.get(uid)
-        requester_name = (requester.name or "").strip() if requester else None
-        if not requester_name and requester:
-            requester_name = requester.username
-        if not requester_name:
-            requester_name = "Unknown user"
+        notify_managers_of_requests(uid, [(sr.id, product_id, product_name, qty)])
+
+        # read before commit so the response doesn't trigger a refresh SELECT
+        body = {"ok": True, "id": sr.id, "status": sr.status}
+        db.session.commit()
+        return jsonify(body), 201
 
-        msg = f"New stock request from {requester_name}: {qty} × {product.name}."
+    @app.post("/api/requests/bulk")
+    @cached_jwt_required()
+    def api_stock_request_bulk():
+        """
+        Several stock requests in one transaction.
+        Body: { "items": [ { "product_id": 1, "quantity": 3 }, ... ] }
+        """
+        claims = get_jwt()
+        uid = claims.get("id")
+        username = (get_jwt_identity() or "").lower()
+        role = token_role(claims)
 
-        for m in managers:
-            n = Notification(
-                user_id=m.id,
-                type="REQUEST_CREATED",
-                message=msg,
-                payload={
-                    "request_id": sr.id,
-                    "product_id": product.id,
-                    "quantity": qty,
-                },
-            )
-            db.session.add(n)
+        if username == "manager" or role == ROLE_MANAGER:
+            return jsonify({"error": "Managers cannot request products"}), 403
 
+        payload = read_json()
+        items = payload.get("items") or []
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "items[] is required"}), 400
+
+        parsed = []
+        for row in items:
+            item, error = parse_stock_request_payload(row)
+            if error:
+                return jsonify({"error": error}), 400
+            parsed.append(item)
+
+        names = dict(
+            db.session.execute(
+                db.select(Product.id, Product.name).where(
+                    Product.id.in_({pid for pid, _ in parsed})
+                )
+            ).all()
+        )
+        if any(pid not in names for pid, _ in parsed):
+            return jsonify({"error": "Product not found"}), 404
+
+        created = [
+            StockRequest(product_id=pid, requested_by=uid, quantity=qty)
+            for pid, qty in parsed
+        ]
+        db.session.add_all(created)
+        db.session.flush()
+
+        notify_managers_of_requests(
+            uid,
+            [
+                (sr.id, sr.product_id, names[sr.product_id], sr.quantity)
+                for sr in created
+            ],
+        )
+
+        body = {
+            "ok": True,
+            "count": len(created),
+            "items": [{"id": sr.id, "status": sr.status} for sr in created],
+        }
         db.session.commit()
-        return jsonify({"ok": True, "id": sr.id, "status": sr.status}), 201
+        return jsonify(body), 201
 
     @app.get("/api/requests")
     @jwt_required()
     def api_requests_list():
+        """
+        Optional ?limit= / ?before=<request id> keyset pagination (see
+        "List pagination"); without them the whole list is returned.
+        """
         claims = get_jwt()
         uid = claims.get("id")
-        role = (claims.get("role") or "").lower()
-
-        q = StockRequest.query.join(Product, StockRequest.product_id == Product.id)
-        if role != "manager":
-            q = q.filter(StockRequest.requested_by == uid)
-
-        rows = q.order_by(StockRequest.created_at.desc()).all()
+        role = token_role(claims)
+        limit = parse_limit()
+        before = request.args.get("before", type=int)
+
+        # one round trip of plain columns: product via the inner join,
+        # requester via an outer join (username is NULL if the user is gone)
+        stmt = (
+            db.select(
+                StockRequest.id,
+                StockRequest.product_id,
+                Product.name,
+                StockRequest.quantity,
+                StockRequest.status,
+                StockRequest.created_at,
+                User.name,
+                User.username,
+            )
+            .join(Product, StockRequest.product_id == Product.id)
+            .outerjoin(User, StockRequest.requested_by == User.id)
+            .order_by(*newest_first(StockRequest))
+        )
+        if role != ROLE_MANAGER:
+            stmt = stmt.where(StockRequest.requested_by == uid)
+        if before is not None:
+            stmt = stmt.where(keyset_before(StockRequest, before))
+        if limit is not None:
+            stmt = stmt.limit(limit)
 
         result = []
-        for r in rows:
-            requester = User.query.get(r.requested_by) if r.requested_by else None
-            if requester:
-                display_name = (requester.name or "").strip() or requester.username
+        for (
+            rid,
+            product_id,
+            product_name,
+            qty,
+            status,
+            created_at,
+            requester_name,
+            requester_username,
+        ) in db.session.execute(stmt):
+            if requester_username is not None:
+                display_name = (requester_name or "").strip() or requester_username
             else:
                 display_name = None
 
             result.append(
                 {
-                    "id": r.id,
-                    "product_id": r.product_id,
-                    "product_name": r.product.name if r.product else None,
-                    "requested_qty": r.quantity,
-                    "status": r.status,
-                    "created_at": to_eastern_iso(r.created_at),
+                    "id": rid,
+                    "product_id": product_id,
+                    "product_name": product_name,
+                    "requested_qty": qty,
+                    "status": status,
+                    "created_at": to_eastern_iso(created_at),
                     "requested_by_name": display_name,
                 }
             )
@@ -1185,18 +1781,18 @@ def create_app():
     def api_request_update(rid: int):
         claims = get_jwt()
         uid = claims.get("id")
-        role = (claims.get("role") or "").lower()
+        role = token_role(claims)
 
-        r = StockRequest.query.get(rid)
+        r = db.session.get(StockRequest, rid, options=STOCK_REQUEST_WRITE_OPTIONS)
         if not r:
             return jsonify({"error": "Request not found"}), 404
 
-        if r.requested_by != uid or role == "manager":
+        if r.requested_by != uid or role == ROLE_MANAGER:
             return jsonify({"error": "You can only edit your own pending requests"}), 403
         if r.status != "Pending":
             return jsonify({"error": "Only pending requests can be edited"}), 400
 
-        data = request.get_json() or {}
+        data = read_json()
         try:
             new_product_id = int(data.get("product_id", r.product_id))
             new_qty = int(data.get("quantity", r.quantity))
@@ -1206,8 +1802,9 @@ def create_app():
         if new_qty <= 0:
             return jsonify({"error": "Quantity must be > 0"}), 400
 
-        product = Product.query.get(new_product_id)
-        if not product:
+        if not db.session.scalar(
+            db.select(db.literal(True)).where(Product.id == new_product_id)
+        ):
             return jsonify({"error": "Product not found"}), 404
 
         r.product_id = new_product_id
@@ -1232,13 +1829,13 @@ def create_app():
     def api_request_delete(rid: int):
         claims = get_jwt()
         uid = claims.get("id")
-        role = (claims.get("role") or "").lower()
+        role = token_role(claims)
 
-        r = StockRequest.query.get(rid)
+        r = db.session.get(StockRequest, rid, options=STOCK_REQUEST_WRITE_OPTIONS)
         if not r:
             return jsonify({"error": "Request not found"}), 404
 
-        if r.requested_by != uid or role == "manager":
+        if r.requested_by != uid or role == ROLE_MANAGER:
             return jsonify({"error": "You can only delete your own pending requests"}), 403
         if r.status != "Pending":
             return jsonify({"error": "Only pending requests can be deleted"}), 400
@@ -1248,130 +1845,167 @@ def create_app():
         return jsonify({"ok": True, "id": rid}), 200
 
     @app.post("/api/requests/<int:rid>/approve")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only manager can approve requests")
     def api_request_approve(rid: int):
-        claims = get_jwt()
-        role = (claims.get("role") or "").lower()
-        if role != "manager":
-            return jsonify({"error": "Only manager can approve requests"}), 403
-
-        r = StockRequest.query.get(rid)
-        if not r:
+        row = db.session.execute(REQUEST_DECISION_STMT, {"rid": rid}).first()
+        if row is None:
             return jsonify({"error": "Request not found"}), 404
+        product_id, requested_by, qty, status, product_name = row
 
-        if r.status == "Approved":
-            return jsonify({"ok": True, "status": r.status}), 200
+        if status == "Approved":
+            return jsonify({"ok": True, "status": status}), 200
 
-        product = Product.query.get(r.product_id)
-        if not product:
+        if product_name is None:
             return jsonify({"error": "Product not found"}), 404
 
-        product.quantity = (product.quantity or 0) + r.quantity
-        r.status = "Approved"
+        # Claim the Pending -> Approved transition in SQL so two managers
+        # approving at once can't both add the quantity, then let the DB do
+        # the increment (no read-modify-write on product.quantity).
+        claimed = db.session.execute(
+            db.update(StockRequest)
+            .where(StockRequest.id == rid, StockRequest.status != "Approved")
+            .values(status="Approved"),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return jsonify({"ok": True, "status": "Approved"}), 200
+
+        db.session.execute(
+            db.update(Product)
+            .where(Product.id == product_id)
+            .values(quantity=db.func.coalesce(Product.quantity, 0) + qty),
+            execution_options={"synchronize_session": False},
+        )
 
-        msg = f"Request approved: {r.quantity} × {product.name}."
-        n = Notification(
-            user_id=r.requested_by,
-            type="REQUEST_APPROVED",
-            message=msg,
-            payload={"request_id": r.id, "product_id": product.id},
+        msg = f"Request approved: {qty} × {product_name}."
+        db.session.execute(
+            db.insert(Notification).values(
+                user_id=requested_by,
+                type="REQUEST_APPROVED",
+                message=msg,
+                payload={"request_id": rid, "product_id": product_id},
+                is_read=False,
+            )
         )
-        db.session.add(n)
 
         db.session.commit()
-        return jsonify({"ok": True, "status": r.status}), 200
+        invalidate_products_cache()
+        return jsonify({"ok": True, "status": "Approved"}), 200
 
     @app.post("/api/requests/<int:rid>/deny")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only manager can deny requests")
     def api_request_deny(rid: int):
-        claims = get_jwt()
-        role = (claims.get("role") or "").lower()
-        if role != "manager":
-            return jsonify({"error": "Only manager can deny requests"}), 403
-
-        r = StockRequest.query.get(rid)
-        if not r:
+        row = db.session.execute(REQUEST_DECISION_STMT, {"rid": rid}).first()
+        if row is None:
             return jsonify({"error": "Request not found"}), 404
+        product_id, requested_by, qty, status, pname = row
 
-        if r.status == "Denied":
-            return jsonify({"ok": True, "status": r.status}), 200
+        if status == "Denied":
+            return jsonify({"ok": True, "status": status}), 200
 
-        data = request.get_json() or {}
+        data = read_json()
         reason = (data.get("reason") or "").strip()
-
-        product = Product.query.get(r.product_id)
-        pname = product.name if product else "product"
-
-        r.status = "Denied"
-
-        msg = f"Request denied: {r.quantity} × {pname}."
+        pname = pname or "product"
+
+        # same claim-in-SQL as approve: only one deny sends a notification
+        claimed = db.session.execute(
+            db.update(StockRequest)
+            .where(StockRequest.id == rid, StockRequest.status != "Denied")
+            .values(status="Denied"),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return jsonify({"ok": True, "status": "Denied"}), 200
+
+        msg = f"Request denied: {qty} × {pname}."
         if reason:
             msg += f" Reason: {reason}"
 
-        n = Notification(
-            user_id=r.requested_by,
-            type="REQUEST_DENIED",
-            message=msg,
-            payload={"request_id": r.id, "product_id": r.product_id, "reason": reason},
+        db.session.execute(
+            db.insert(Notification).values(
+                user_id=requested_by,
+                type="REQUEST_DENIED",
+                message=msg,
+                payload={
+                    "request_id": rid,
+                    "product_id": product_id,
+                    "reason": reason,
+                },
+                is_read=False,
+            )
         )
-        db.session.add(n)
 
         db.session.commit()
-        return jsonify({"ok": True, "status": r.status}), 200
+        # the claim can flip an Approved request (and a concurrent approve may
+        # have landed since the read above), so approved totals may change
+        invalidate_reports_cache()
+        return jsonify({"ok": True, "status": "Denied"}), 200
 
     # ---------- Notifications ----------
     @app.get("/api/notifications")
     @jwt_required()
     def api_notifications_list():
+        """
+        Optional ?limit= / ?before=<notification id> keyset pagination (see
+        "List pagination"); without them the whole list is returned.
+        """
         claims = get_jwt()
         uid = claims.get("id")
-        role = (claims.get("role") or "").lower()
-
-        if role == "manager":
-            run_low_stock_scan()
-
-        all_items = (
-            Notification.query.filter_by(user_id=uid)
-            .order_by(Notification.created_at.desc())
-            .all()
-        )
-
-        seen_low_stock = set()
-        filtered_items = []
-
-        for n in all_items:
-            if n.type == "LOW_STOCK":
-                product_id = None
-                if isinstance(n.payload, dict):
-                    product_id = n.payload.get("product_id")
-
-                if product_id is not None:
-                    key = ("LOW_STOCK", product_id)
-                else:
-                    key = ("LOW_STOCK", (n.message or "").split(" has only")[0])
+        role = token_role(claims)
+        limit = parse_limit()
+        before = request.args.get("before", type=int)
+
+        if role == ROLE_MANAGER:
+            maybe_run_low_stock_scan()
+
+        stmt = visible_notifications(
+            uid,
+            Notification.id,
+            Notification.type,
+            Notification.message,
+            Notification.payload,
+            Notification.is_read,
+            Notification.created_at,
+        ).order_by(*newest_first(Notification))
+        if before is not None:
+            stmt = stmt.where(
+                keyset_before(Notification, before, Notification.user_id == uid)
+            )
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        rows = db.session.execute(stmt).all()
 
-                if key in seen_low_stock:
-                    continue
-                seen_low_stock.add(key)
+        items = [
+            {
+                "id": nid,
+                "type": ntype,
+                "message": message,
+                "payload": payload,
+                "is_read": is_read,
+                "created_at": to_eastern_iso(created_at),
+            }
+            for nid, ntype, message, payload, is_read, created_at in rows
+        ]
 
-            filtered_items.append(n)
+        # polled constantly: answer unchanged lists with 304; max-age=0 so the
+        # client always revalidates (read / new state shows up immediately)
+        return conditional_json(app.json.dumps_bytes(items), max_age=0)
 
-        return (
-            jsonify(
-                [
-                    {
-                        "id": n.id,
-                        "type": n.type,
-                        "message": n.message,
-                        "payload": n.payload,
-                        "is_read": n.is_read,
-                        "created_at": to_eastern_iso(n.created_at),
-                    }
-                    for n in filtered_items
-                ]
-            ),
-            200,
+    @app.get("/api/notifications/count")
+    @jwt_required()
+    def api_notifications_count():
+        """Unread count for the badge; counts the same rows the list shows."""
+        uid = get_jwt().get("id")
+        unread = db.session.scalar(
+            visible_notifications(uid, db.func.count(Notification.id)).where(
+                db.or_(Notification.is_read.is_(False), Notification.is_read.is_(None))
+            )
         )
+        return jsonify({"unread": unread}), 200
 
     @app.post("/api/notifications/<int:nid>/read")
     @jwt_required()
@@ -1379,7 +2013,11 @@ def create_app():
         claims = get_jwt()
         uid = claims.get("id")
 
-        n = Notification.query.filter_by(id=nid, user_id=uid).first()
+        n = db.session.scalar(
+            db.select(Notification).where(
+                Notification.id == nid, Notification.user_id == uid
+            )
+        )
         if not n:
             return jsonify({"error": "Notification not found"}), 404
 
@@ -1388,56 +2026,46 @@ def create_app():
         return jsonify({"ok": True}), 200
 
     @app.post("/api/scan-low-stock")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only manager can trigger low stock scan")
     def api_scan_low_stock():
-        claims = get_jwt()
-        role = (claims.get("role") or "").lower()
-        if role != "manager":
-            return jsonify({"error": "Only manager can trigger low stock scan"}), 403
-
         run_low_stock_scan()
         return jsonify({"ok": True}), 200
 
     # ---------- Reports ----------
     @app.get("/api/reports/summary")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only manager can view reports")
+    @cached_report
     def api_reports_summary():
-        claims = get_jwt()
-        role = (claims.get("role") or "").lower()
-        if role != "manager":
-            return jsonify({"error": "Only manager can view reports"}), 403
-
-        total_products = Product.query.count()
-        low_stock_count = sum(
-            1 for p in Product.query.all() if is_low_stock_product(p)
-        )
-
-        inventory_value = (
-            db.session.query(
-                db.func.coalesce(db.func.sum(Product.quantity * Product.price), 0)
-            ).scalar()
-            or 0
-        )
+        # one round trip; SUM(CASE ...) instead of COUNT(*) FILTER (WHERE ...),
+        # which MySQL doesn't support
+        total_products, low_stock_count, inventory_value = db.session.execute(
+            db.select(
+                db.func.count(Product.id),
+                db.func.coalesce(
+                    db.func.sum(db.case((Product.is_low_stock, 1), else_=0)), 0
+                ),
+                db.func.coalesce(db.func.sum(Product.quantity * Product.price), 0),
+            )
+        ).one()
 
         return (
             jsonify(
                 {
                     "total_products": total_products,
-                    "low_stock_count": low_stock_count,
-                    "inventory_value": float(inventory_value),
+                    "low_stock_count": int(low_stock_count),
+                    "inventory_value": inventory_value,
                 }
             ),
             200,
         )
 
     @app.get("/api/reports/usage")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only manager can view reports")
+    @cached_report
     def api_reports_usage():
-        claims = get_jwt()
-        role = (claims.get("role") or "").lower()
-        if role != "manager":
-            return jsonify({"error": "Only manager can view reports"}), 403
-
         # Existing "range" (weekly / monthly) + support for month=YYYY-MM
         range_param = (request.args.get("range") or "weekly").lower()
         month_param = request.args.get("month")  # e.g. "2025-11"
@@ -1466,30 +2094,13 @@ def create_app():
             end = now_utc
             start = end - timedelta(days=days)
 
-        q = (
-            db.session.query(
-                Product.id.label("product_id"),
-                Product.name.label("product_name"),
-                db.func.sum(StockRequest.quantity).label("total_requested"),
-                db.func.coalesce(
-                    db.func.sum(StockRequest.quantity * Product.price), 0
-                ).label("total_cost"),
-            )
-            .join(Product, StockRequest.product_id == Product.id)
-            .filter(StockRequest.status == "Approved")
-            .filter(StockRequest.created_at >= start)
-            .filter(StockRequest.created_at < end)
-            .group_by(Product.id, Product.name)
-            .order_by(db.func.sum(StockRequest.quantity).desc())
-        )
-
-        rows = q.all()
+        rows = db.session.execute(USAGE_STMT, {"start": start, "end": end}).all()
         data = [
             {
                 "product_id": r.product_id,
                 "product_name": r.product_name,
                 "total_requested": int(r.total_requested or 0),
-                "total_cost": float(r.total_cost or 0),
+                "total_cost": r.total_cost or 0.0,
             }
             for r in rows
         ]
@@ -1497,13 +2108,10 @@ def create_app():
         return jsonify({"range": range_param, "items": data}), 200
 
     @app.get("/api/reports/cost-analysis")
-    @jwt_required()
+    @cached_jwt_required()
+    @require_role(ROLE_MANAGER, "Only manager can view reports")
+    @cached_report
     def api_reports_cost_analysis():
-        claims = get_jwt()
-        role = (claims.get("role") or "").lower()
-        if role != "manager":
-            return jsonify({"error": "Only manager can view reports"}), 403
-
         # Existing range param (weekly / monthly)
         range_param = (request.args.get("range") or "weekly").lower()
 
@@ -1560,64 +2168,23 @@ def create_app():
             end = now_utc
             start = end - timedelta(days=days)
 
-        # Use DATE(created_at) for x-axis labels
-        day_expr = db.func.date(StockRequest.created_at)
-
-        # ---------- Line chart: cost over time ----------
-        q_line = (
-            db.session.query(
-                day_expr.label("day"),
-                db.func.coalesce(
-                    db.func.sum(StockRequest.quantity * Product.price), 0
-                ).label("total_cost"),
-            )
-            .join(Product, StockRequest.product_id == Product.id)
-            .filter(StockRequest.status == "Approved")
-            .filter(StockRequest.created_at >= start)
-            .filter(StockRequest.created_at < end)
-            .group_by(day_expr)
-            .order_by(day_expr)
-        )
+        window = {"start": start, "end": end}
 
-        line_rows = q_line.all()
+        # line chart (cost over time, "MM/DD" labels) and breakdown (cost by
+        # category) in one round trip
         points = []
-        for r in line_rows:
-            day = r.day
-            if hasattr(day, "strftime"):
-                label = day.strftime("%m/%d")
+        breakdown = []
+        for kind, key, total_cost in db.session.execute(COST_ANALYSIS_STMT, window):
+            if kind == "day":
+                points.append(
+                    {
+                        "label": f"{key[5:7]}/{key[8:10]}",
+                        "total_cost": total_cost or 0.0,
+                    }
+                )
             else:
-                label = str(day)
-            points.append(
-                {
-                    "label": label,
-                    "total_cost": float(r.total_cost or 0),
-                }
-            )
-
-        # ---------- Breakdown: cost by category ----------
-        q_breakdown = (
-            db.session.query(
-                Product.category.label("category"),
-                db.func.coalesce(
-                    db.func.sum(StockRequest.quantity * Product.price), 0
-                ).label("total_cost"),
-            )
-            .join(Product, StockRequest.product_id == Product.id)
-            .filter(StockRequest.status == "Approved")
-            .filter(StockRequest.created_at >= start)
-            .filter(StockRequest.created_at < end)
-            .group_by(Product.category)
-            .order_by(db.func.sum(StockRequest.quantity * Product.price).desc())
-        )
-
-        breakdown_rows = q_breakdown.all()
-        breakdown = [
-            {
-                "category": r.category,
-                "total_cost": float(r.total_cost or 0),
-            }
-            for r in breakdown_rows
-        ]
+                breakdown.append({"category": key, "total_cost": total_cost or 0.0})
+        breakdown.sort(key=lambda b: b["total_cost"], reverse=True)
 
         return (
             jsonify(
@@ -1635,7 +2202,12 @@ def create_app():
     # ---------- Health ----------
     @app.get("/api/health")
     def api_health():
-        return jsonify({"ok": True}), 200
+        # probes must always reach the process, never a cache in between
+        return app.response_class(
+            HEALTH_BODY,
+            mimetype="application/json",
+            headers={"Cache-Control": "no-store"},
+        )
 
     # ---------- CLI: init-db ----------
     @app.cli.command("init-db")
@@ -1643,7 +2215,9 @@ def create_app():
         with app.app_context():
             db.create_all()
             created = False
-            if not User.query.filter_by(username="manager").first():
+            if not db.session.scalar(
+                db.select(User.id).where(User.username == "manager")
+            ):
                 m = User(
                     username="manager",
                     name="Default Manager",
@@ -1654,7 +2228,9 @@ def create_app():
                 db.session.add(m)
                 created = True
 
-            if not User.query.filter_by(username="cook").first():
+            if not db.session.scalar(
+                db.select(User.id).where(User.username == "cook")
+            ):
                 c = User(
                     username="cook",
                     name="Default Cook",
@@ -1671,6 +2247,21 @@ def create_app():
             print("DB ready.")
             
             
+    # ---------- CLI: create-indexes ----------
+    @app.cli.command("create-indexes")
+    def create_indexes():
+        """Add indexes declared in models.py to an existing database."""
+        with app.app_context():
+            for table in db.metadata.sorted_tables:
+                for ix in table.indexes:
+                    try:
+                        ix.create(db.engine)
+                        print(f"Created {ix.name}.")
+                    except DBAPIError:
+                        # expression indexes can't be reflected, so
+                        # checkfirst won't work; treat errors as "exists"
+                        print(f"Skipped {ix.name} (already exists).")
+
     @app.route("/debug-login-url")
     def debug_login_url():
         return f"DEBUG: LOGIN_PAGE_URL = {LOGIN_PAGE_URL}"
@@ -1683,4 +2274,6 @@ app = create_app()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5001))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    # dev server only (production runs gunicorn, see gunicorn.conf.py);
+    # the debugger / reloader is opt-in so it can't end up exposed by accident
+    app.run(host="0.0.0.0", port=port, debug=os.environ.get("FLASK_DEBUG") == "1")
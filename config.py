@@ -22,6 +22,9 @@ if not os.getenv("MYSQL_USER") or not os.getenv("MYSQL_DB"):
 class Config:
     # ----- core secrets -----
     SECRET_KEY = os.getenv("SECRET_KEY", "devkey")
+    # HS256 = one HMAC pass per verify; use a 32+ byte JWT_SECRET_KEY
+    JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", SECRET_KEY)
+    JWT_ALGORITHM = "HS256"
 
     # ----- database (existing) -----
     MYSQL_USER = os.getenv("MYSQL_USER")
@@ -35,6 +38,32 @@ class Config:
         f"@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # each gunicorn worker builds its own engine/pool after fork;
+    # pre-ping drops connections the DB proxy closed while idle.
+    # Keep DB_POOL_SIZE x workers under the server's max_connections.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+        "max_overflow": 0,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        # compiled-statement cache; room for every query shape the API uses
+        "query_cache_size": 1200,
+    }
+
+    # ----- uploads -----
+    # Flask's default is None (no cap); image parts stream to disk while the
+    # body is parsed, so bound the whole request body.
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    # product forms are ~10 short text fields plus one image. Flask defaults
+    # these to 500000 / 1000; the memory cap must stay above
+    # MULTIPART_BUFFER_SIZE in app.py.
+    MAX_FORM_MEMORY_SIZE = 512 * 1024
+    MAX_FORM_PARTS = 50
+
+    # ----- response compression (flask-compress) -----
+    COMPRESS_ALGORITHM = ["br", "gzip"]
+    COMPRESS_BR_LEVEL = 4
+    COMPRESS_MIN_SIZE = 512
 
     # ----- email (for password reset) -----
     # Configure these in your .env:
@@ -0,0 +1,16 @@
+# gunicorn.conf.py
+# Picked up automatically when gunicorn is started from the repo root:
+#   gunicorn app:app
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+
+# gevent workers multiplex I/O (MySQL round trips, Brevo calls) so one slow
+# request doesn't hold up the rest; gunicorn monkey-patches for us.
+worker_class = "gevent"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_connections = 1000
+
+# mobile clients poll the API; keep their connections open between calls
+keepalive = 30
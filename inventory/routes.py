@@ -37,7 +37,7 @@ def edit_product(pid):
     if not manager_required():
         flash("Manager role required", "warning")
         return redirect(url_for("inventory.list_products"))
-    p = Product.query.get_or_404(pid)
+    p = db.get_or_404(Product, pid)
     if request.method == "POST":
         p.name = request.form["name"].strip()
         p.quantity = int(request.form.get("quantity",0))
@@ -54,7 +54,7 @@ def delete_product(pid):
     if not manager_required():
         flash("Manager role required", "warning")
         return redirect(url_for("inventory.list_products"))
-    p = Product.query.get_or_404(pid)
+    p = db.get_or_404(Product, pid)
     db.session.delete(p); db.session.commit()
     flash("Product deleted", "success")
     return redirect(url_for("inventory.list_products"))
@@ -1,11 +1,24 @@
 # models.py
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
 db = SQLAlchemy()
 
 
+def is_low_stock(qty, threshold) -> bool:
+    """
+    - If reorder_threshold > 0 and quantity <= threshold -> low
+    - OR quantity < 2 as fallback
+    """
+    threshold = threshold or 0
+    qty = qty or 0
+    if threshold > 0 and qty <= threshold:
+        return True
+    return qty < 2
+
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -23,6 +36,10 @@ class User(db.Model):
         return check_password_hash(self.password_hash, raw)
 
 
+# forgot-password looks users up by lower(email)
+db.Index("ix_users_email_lower", db.func.lower(User.email))
+
+
 class Product(db.Model):
     __tablename__ = "products"
 
@@ -39,6 +56,23 @@ class Product(db.Model):
     vendor_contact = db.Column(db.String(255), nullable=True)
     category = db.Column(db.String(80), nullable=True)  # e.g. Produce, Grains, Protein
 
+    @hybrid_property
+    def is_low_stock(self):
+        return is_low_stock(self.quantity, self.reorder_threshold)
+
+    @is_low_stock.expression
+    def is_low_stock(cls):
+        # same rule in SQL; NULL quantity counts as 0
+        qty = db.func.coalesce(cls.quantity, 0)
+        return db.or_(
+            db.and_(cls.reorder_threshold > 0, qty <= cls.reorder_threshold),
+            qty < 2,
+        )
+
+
+# product list is ordered by lower(name)
+db.Index("ix_products_name_lower", db.func.lower(Product.name))
+
 
 class StockRequest(db.Model):
     __tablename__ = "stock_requests"
@@ -55,6 +89,24 @@ class StockRequest(db.Model):
     requester = db.relationship("User", backref="stock_requests")
 
 
+# request list is newest-first; cooks only see their own
+db.Index("ix_stock_requests_created_at", StockRequest.created_at)
+db.Index(
+    "ix_stock_requests_requester_created",
+    StockRequest.requested_by,
+    StockRequest.created_at,
+)
+# reports: range scan over approved requests by date; product_id and quantity
+# ride along so the scan never has to visit the table rows
+db.Index(
+    "ix_stock_requests_report",
+    StockRequest.status,
+    StockRequest.created_at,
+    StockRequest.product_id,
+    StockRequest.quantity,
+)
+
+
 class Notification(db.Model):
     __tablename__ = "notifications"
 
@@ -70,6 +122,11 @@ class Notification(db.Model):
     user = db.relationship("User", backref="notifications")
 
 
+# low-stock scan filters on (type, user_id); the inbox is per user, newest first
+db.Index("ix_notifications_type_user", Notification.type, Notification.user_id)
+db.Index("ix_notifications_user_created", Notification.user_id, Notification.created_at)
+
+
 # 🔐 NEW: Password reset token table
 class PasswordResetToken(db.Model):
     __tablename__ = "password_reset_tokens"